@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import socket
+import struct
+import subprocess
+import threading
+
+# First file descriptor passed by systemd socket activation.
+SD_LISTEN_FDS_START = 3
+
+# Status bytes sent back for each command.
+STATUS_OK = 0
+STATUS_FAILED = 1
+STATUS_REJECTED = 2
+
+
+def tty_number(value):
+    """Validate a TTY number argument."""
+    tty = int(value)
+    if not 1 <= tty <= 63:
+        raise ValueError(f"invalid TTY {value}")
+    return tty
+
+
+COMMANDS = {
+    "restart_tty": lambda tty: [
+        "/bin/systemctl",
+        "restart",
+        f"getty@tty{tty_number(tty)}",
+    ],
+    "start_tty": lambda tty: [
+        "/bin/systemctl",
+        "start",
+        f"getty@tty{tty_number(tty)}",
+    ],
+    "chvt": lambda tty: ["/bin/chvt", f"{tty_number(tty)}"],
+    "stop_gdm": lambda: ["/bin/systemctl", "stop", "gdm"],
+}
+
+
+def log(message):
+    """Log a message to stdout."""
+    print(message, flush=True)
+
+
+def execute(line):
+    """Run a whitelisted command line and return its status byte."""
+    name, *args = line.split()
+    try:
+        argv = COMMANDS[name](*args)
+    except (KeyError, TypeError, ValueError):
+        log(f"Rejected: {line.strip()}")
+        return STATUS_REJECTED
+    log("Executing: " + " ".join(argv))
+    if subprocess.run(argv, check=False).returncode != 0:
+        return STATUS_FAILED
+    return STATUS_OK
+
+
+def serve(conn):
+    """Answer every command sent over a client connection."""
+    creds = conn.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+    )
+    pid, uid, _ = struct.unpack("3i", creds)
+    log(f"Client connected (pid {pid}, uid {uid})")
+    try:
+        with conn, conn.makefile("r") as lines:
+            for line in lines:
+                if not line.strip():
+                    continue
+                conn.sendall(bytes([execute(line)]))
+    except ConnectionError as e:
+        log(f"Client connection lost (pid {pid}): {e}")
+        return
+    log(f"Client disconnected (pid {pid})")
+
+
+def main():
+    """Accept helper clients on the socket passed by systemd."""
+
+    if os.environ.get("LISTEN_PID") != str(os.getpid()) or not int(
+        os.environ.get("LISTEN_FDS", "0")
+    ):
+        print(f"Usage: {sys.argv[0]} must be started by gamepad-helper.socket")
+        sys.exit(1)
+
+    server = socket.socket(fileno=SD_LISTEN_FDS_START)
+    while True:
+        conn, _ = server.accept()
+        threading.Thread(target=serve, args=(conn,), daemon=True).start()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,73 +2,303 @@
 
 import os
 import sys
+import atexit
+import glob
+import zlib
+import types
+import operator
+import functools
+import fcntl
+import struct
+import socket
+import selectors
 import time
 import signal
 import subprocess
-import evdev
 from evdev import ecodes
 
+try:
+    from gi.repository import GLib
+    from pydbus import SystemBus
+except ImportError:
+    GLib = None
+    SystemBus = None
+
+# DualSense (and DualSense Edge) USB IDs, and the HID bus type for Bluetooth.
+SONY_VENDOR_ID = 0x054C
+DUALSENSE_PRODUCT_IDS = (0x0CE6, 0x0DF2)
+BUS_BLUETOOTH = 0x05
+
+# Bound once so handle_event does not look them up on every event.
+EV_SYN = ecodes.EV_SYN
+EV_KEY = ecodes.EV_KEY
+EV_ABS = ecodes.EV_ABS
+
+# struct input_event: timeval, type, code, value.
+INPUT_EVENT = struct.Struct("llHHi")
+
+# struct input_absinfo: value, minimum, maximum, fuzz, flat, resolution.
+INPUT_ABSINFO = struct.Struct("6i")
+STICK_AXES = (ecodes.ABS_X, ecodes.ABS_Y, ecodes.ABS_RX, ecodes.ABS_RY)
+
+
+def EVIOCGABS(axis):
+    """_IOR('E', 0x40 + axis, struct input_absinfo)"""
+    return (2 << 30) | (INPUT_ABSINFO.size << 16) | (ord("E") << 8) | (0x40 + axis)
+
+
+def EVIOCSABS(axis):
+    """_IOW('E', 0xc0 + axis, struct input_absinfo)"""
+    return (1 << 30) | (INPUT_ABSINFO.size << 16) | (ord("E") << 8) | (0xC0 + axis)
+
 
 class GamepadController:
     """A class to handle gamepad input events and perform actions based on button combinations."""
 
-    reset_combo = [
-        ecodes.BTN_TL,
-        ecodes.BTN_TR,
-        ecodes.BTN_MODE,
-    ]
+    reset_combo = frozenset(
+        (
+            ecodes.BTN_TL,
+            ecodes.BTN_TR,
+            ecodes.BTN_MODE,
+        )
+    )
+
+    tty11_combo = frozenset(
+        (
+            ecodes.BTN_MODE,
+            ecodes.BTN_SOUTH,
+        )
+    )
+
+    mangohud_combo = frozenset(
+        (
+            ecodes.BTN_MODE,
+            ecodes.BTN_WEST,
+        )
+    )
 
-    tty11_combo = [
-        ecodes.BTN_MODE,
-        ecodes.BTN_SOUTH,
-    ]
+    xboxdrv_combo = frozenset(
+        (
+            ecodes.BTN_MODE,
+            ecodes.BTN_START,
+        )
+    )
 
-    mangohud_combo = [
-        ecodes.BTN_MODE,
-        ecodes.BTN_WEST,
-    ]
+    makima_combo = frozenset(
+        (
+            ecodes.BTN_MODE,
+            ecodes.BTN_SELECT,
+        )
+    )
 
-    xboxdrv_combo = [
-        ecodes.BTN_MODE,
-        ecodes.BTN_START,
-    ]
+    helper_socket_path = "/run/gamepad-helper.sock"
 
-    makima_combo = [
-        ecodes.BTN_MODE,
-        ecodes.BTN_SELECT,
-    ]
+    # Disconnect Bluetooth controllers after this many idle seconds.
+    idle_timeout = 300
+
+    # Replace handle_event with code generated for this controller's combos.
+    specialize_handler = True
+
+    # Maximum time (in seconds) to wait for BlueZ to resolve services.
+    bt_ready_timeout = 2.0
+
+    # Kernel fuzz for the stick axes, only enough to drop sensor noise on
+    # a resting stick. It applies to every reader of the device, so keep it
+    # small; activity is still judged by the 120..140 check in handle_event.
+    stick_fuzz = 4
+
+    _system_bus = None
 
     def __init__(self, mac):
         self.mac = mac
         self.device_path = f"/dev/gamepad-{mac}"
         self.xboxdrv_process = None
-        self.is_bluetooth = (
-            mac.upper()
-            in subprocess.run(
-                ["bluetoothctl", "devices", "Connected"],
-                capture_output=True,
-                text=True,
-                check=False,
-            ).stdout
+        self._helper = None
+        self._log_buffer = []
+        # Also covers messages queued by a constructor that then fails.
+        atexit.register(self.flush_log)
+        self._devnull = os.open(os.devnull, os.O_RDWR)
+        self._hidraw_fd, self._hidraw_bus = self._open_hidraw()
+        self._hidraw_seq = 0
+        self._saved_absinfo = {}
+        self.is_bluetooth = self._is_bt_connected(mac)
+        self.last_timestamp = time.monotonic()
+        self._last_lightbar = None
+        self._event_struct = INPUT_EVENT
+        self._event_buffer = bytearray(INPUT_EVENT.size * 64)
+        # Checked in order; the first combo that is fully held wins.
+        combos = (
+            (self.reset_combo, "reset", self.restart_tty),
+            (self.tty11_combo, "tty11", lambda: self.enable_tty(11)),
+            (self.mangohud_combo, "mangohud", self.toggle_mangohud),
+            (self.xboxdrv_combo, "xboxdrv", self.toggle_xboxdrv),
         )
-        self.pressed_buttons = set()
-        self.last_timestamp = time.time()
+        # Held combo buttons are tracked in a bitmask, one bit per button.
+        combo_buttons = sorted(set().union(*(combo for combo, _, _ in combos)))
+        self._combo_buttons = frozenset(combo_buttons)
+        self._button_bits = {code: 1 << i for i, code in enumerate(combo_buttons)}
+        self._pressed_bits = 0
+        self._combo_table = tuple(
+            (self._combo_mask(combo), name, handler) for combo, name, handler in combos
+        )
+        # Bits shared by every combo (BTN_MODE); nothing can match without them.
+        self._combo_gate = functools.reduce(
+            operator.and_, (mask for mask, _, _ in self._combo_table)
+        )
+        if self.specialize_handler:
+            self.handle_event = self._specialized_handle_event()
+
+    def _combo_mask(self, combo):
+        """Return the pressed-button bitmask of a combo."""
+        return functools.reduce(operator.or_, (self._button_bits[c] for c in combo))
+
+    @classmethod
+    def _get_system_bus(cls):
+        """Return the system D-Bus connection, shared by all instances."""
+        if cls._system_bus is None:
+            cls._system_bus = SystemBus()
+        return cls._system_bus
+
+    def _is_bt_connected(self, mac):
+        """Check whether the controller is connected over Bluetooth."""
+        address = mac.upper()
+        if SystemBus is None:
+            return (
+                address
+                in subprocess.run(
+                    ["bluetoothctl", "devices", "Connected"],
+                    capture_output=True,
+                    text=True,
+                    check=False,
+                ).stdout
+            )
+
+        _, device = self._find_bt_device(address)
+        return bool(device and device.get("Connected"))
+
+    def _find_bt_device(self, address):
+        """Return the BlueZ object path and properties of a device, or (None, None)."""
+        try:
+            manager = self._get_system_bus().get("org.bluez", "/")
+            objects = manager.GetManagedObjects()
+        except GLib.Error as e:
+            self.log(f"Cannot query BlueZ: {e}")
+            return None, None
+        for path, interfaces in objects.items():
+            device = interfaces.get("org.bluez.Device1")
+            if device and device.get("Address") == address:
+                return path, device
+        return None, None
 
     def log(self, message):
-        """Log a message to stdout with a timestamp."""
-        print(message, flush=True)
+        """Queue a message for stdout; see flush_log.
+
+        Messages are written when the main loop goes back to waiting for events,
+        so lines logged during a slow action (e.g. stopping GDM through the
+        helper) only appear once that action has returned.
+        """
+        self._log_buffer.append(message)
+
+    def flush_log(self):
+        """Write all queued log messages to stdout at once."""
+        if not self._log_buffer:
+            return
+        sys.stdout.write("\n".join(self._log_buffer) + "\n")
+        sys.stdout.flush()
+        self._log_buffer.clear()
 
     def run(self, args):
-        """Run a command with subprocess and log the command."""
+        """Run a command with posix_spawn, wait for it and log the command."""
         self.log("Executing: " + " ".join(args))
-        subprocess.run(args, check=False)
+        # The child writes to the same stdout; keep our lines ahead of its output.
+        self.flush_log()
+        # Undo the SIGPIPE/SIGXFSZ ignores Python sets up, like subprocess does.
+        pid = os.posix_spawnp(
+            args[0], args, os.environ, setsigdef=(signal.SIGPIPE, signal.SIGXFSZ)
+        )
+        os.waitpid(pid, 0)
+
+    def _helper_send(self, command):
+        """Send a command line to the privileged helper and return its status byte."""
+        self.log("Helper: " + command.strip())
+        for attempt in range(2):
+            try:
+                if self._helper is None:
+                    # No timeout: stopping GDM may take up to its TimeoutStopSec.
+                    self._helper = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    self._helper.connect(self.helper_socket_path)
+                self._helper.sendall(command.encode())
+                status = self._helper.recv(1)
+                if not status:
+                    raise ConnectionResetError("helper closed the connection")
+                return status[0]
+            except OSError as e:
+                if self._helper is not None:
+                    self._helper.close()
+                    self._helper = None
+                # Reconnect once in case the cached connection went stale.
+                if attempt or not isinstance(e, ConnectionError):
+                    self.log(f"Helper unavailable: {e}")
+                    return None
+        return None
 
     def disconnect_bluetooth(self):
-        """Disconnect the Bluetooth controller using bluetoothctl."""
+        """Disconnect the Bluetooth controller through BlueZ."""
         if not self.is_bluetooth:
             return
         bt_mac = self.mac.upper()
-        os.system(f"echo disconnect {bt_mac} | bluetoothctl")
+        if SystemBus is None:
+            self.run(["bluetoothctl", "disconnect", bt_mac])
+            return
+
+        path, _ = self._find_bt_device(bt_mac)
+        if path is None:
+            self.log(f"Bluetooth device {bt_mac} not found.")
+            return
+        try:
+            device = self._get_system_bus().get("org.bluez", path)
+            device["org.bluez.Device1"].Disconnect(timeout=5)
+        except GLib.Error as e:
+            self.log(f"Failed to disconnect {bt_mac}: {e}")
+
+    def wait_bt_ready(self):
+        """Wait until BlueZ reports the controller's services as resolved."""
+        if SystemBus is None:
+            time.sleep(1.0)
+            return
+
+        path, _ = self._find_bt_device(self.mac.upper())
+        if path is None:
+            return
+
+        loop = GLib.MainLoop()
+
+        def on_properties_changed(sender, obj, iface, _signal, params):
+            interface, changed, _ = params
+            # A second match may be dispatched before loop.run() returns.
+            if not loop.is_running():
+                return
+            if interface == "org.bluez.Device1" and changed.get("ServicesResolved"):
+                GLib.source_remove(timeout_id)
+                loop.quit()
+
+        try:
+            bus = self._get_system_bus()
+            # Subscribe before reading the property so the change cannot be missed.
+            with bus.subscribe(
+                iface="org.freedesktop.DBus.Properties",
+                signal="PropertiesChanged",
+                object=path,
+                signal_fired=on_properties_changed,
+            ):
+                if bus.get("org.bluez", path)["org.bluez.Device1"].ServicesResolved:
+                    return
+                timeout_id = GLib.timeout_add(
+                    int(self.bt_ready_timeout * 1000), loop.quit
+                )
+                loop.run()
+        except GLib.Error as e:
+            self.log(f"Cannot wait for Bluetooth services: {e}")
 
     def remove_notv_file(self):
         """Remove the /tmp/notv file if it exists."""
@@ -84,23 +314,20 @@ class GamepadController:
 
         self.log("Restarting TTY...")
 
-        result = subprocess.run(
-            ["sudo", "fgconsole"], capture_output=True, text=True, check=False
-        )
-
-        tty = int(result.stdout.strip())
+        with open("/sys/class/tty/tty0/active") as f:
+            tty = int(f.read().strip().removeprefix("tty"))
         if tty < 9:
             self.log(f"Active TTY is {tty}. Not restarting.")
             return
 
         self.remove_notv_file()
-        self.run(["/bin/sudo", "systemctl", "restart", f"getty@tty{tty}"])
+        self._helper_send(f"restart_tty {tty}\n")
 
     def stop_gdm(self):
         """Stop the GDM service to allow TTY switching."""
 
         self.log("Stopping GDM...")
-        self.run(["sudo", "systemctl", "stop", "gdm"])
+        self._helper_send("stop_gdm\n")
 
     def enable_tty(self, tty):
         """Switch to a specific TTY and start the getty service."""
@@ -108,8 +335,8 @@ class GamepadController:
         self.log(f"Switching to TTY {tty}")
         self.stop_gdm()
         self.remove_notv_file()
-        self.run(["/bin/sudo", "chvt", f"{tty}"])
-        self.run(["/bin/sudo", "systemctl", "start", f"getty@tty{tty}"])
+        self._helper_send(f"chvt {tty}\n")
+        self._helper_send(f"start_tty {tty}\n")
 
     def toggle_mangohud(self):
         """Toggle MangoHud on or off."""
@@ -126,6 +353,7 @@ class GamepadController:
         """Set the lightbar state to on, off, or blink."""
 
         self.run(["dualsensectl", "-d", self.mac, "lightbar", f"{state}"])
+        self._last_lightbar = None
 
     def determine_lightbar_color(self):
         """Determine the lightbar color based on xboxdrv status."""
@@ -137,19 +365,74 @@ class GamepadController:
     def update_lightbar(self):
         """Update the lightbar color based on the current state."""
 
-        r, g, b = self.determine_lightbar_color()
-        i = 50 if self.is_bluetooth else 255
-        self.run(
-            ["dualsensectl", "-d", self.mac, "lightbar", f"{r}", f"{g}", f"{b}", f"{i}"]
-        )
+        self.set_lightbar(*self.determine_lightbar_color())
+
+    def _open_hidraw(self):
+        """Open the DualSense hidraw node for this controller, or return (None, None)."""
+        for uevent_path in glob.glob("/sys/class/hidraw/hidraw*/device/uevent"):
+            with open(uevent_path) as f:
+                uevent = dict(line.rstrip("\n").split("=", 1) for line in f)
+            bus, vendor, product = (int(x, 16) for x in uevent["HID_ID"].split(":"))
+            if (
+                vendor != SONY_VENDOR_ID
+                or product not in DUALSENSE_PRODUCT_IDS
+                or uevent.get("HID_UNIQ", "").lower() != self.mac.lower()
+            ):
+                continue
+            node = os.path.join("/dev", uevent_path.split("/")[4])
+            try:
+                return os.open(node, os.O_WRONLY), bus
+            except OSError as e:
+                self.log(f"Cannot open {node}: {e}")
+        return None, None
+
+    def _lightbar_report(self, r, g, b):
+        """Build a DualSense output report that sets the lightbar color."""
+
+        # struct dualsense_output_report_common: valid_flag1 at 1, RGB at 44-46.
+        common = bytearray(47)
+        common[1] = 0x04  # lightbar control enable
+        common[44:47] = bytes((r, g, b))
+
+        if self._hidraw_bus == BUS_BLUETOOTH:
+            report = bytearray(78)
+            report[0] = 0x31
+            report[1] = self._hidraw_seq << 4
+            report[2] = 0x10
+            report[3:50] = common
+            self._hidraw_seq = (self._hidraw_seq + 1) & 0x0F
+            crc = zlib.crc32(report[:74], zlib.crc32(b"\xa2"))
+            report[74:] = crc.to_bytes(4, "little")
+            return report
+
+        report = bytearray(63)
+        report[0] = 0x02
+        report[1:48] = common
+        return report
 
     def set_lightbar(self, r, g, b):
         """Set the lightbar color to the specified RGB values."""
 
         i = 50 if self.is_bluetooth else 255
+        if self._last_lightbar == (r, g, b, i):
+            return
+
+        if self._hidraw_fd is not None:
+            # Scale by intensity the same way dualsensectl does.
+            report = self._lightbar_report(r * i // 255, g * i // 255, b * i // 255)
+            try:
+                os.write(self._hidraw_fd, report)
+                self._last_lightbar = (r, g, b, i)
+                return
+            except OSError as e:
+                self.log(f"hidraw write failed: {e}")
+                os.close(self._hidraw_fd)
+                self._hidraw_fd = None
+
         self.run(
             ["dualsensectl", "-d", self.mac, "lightbar", f"{r}", f"{g}", f"{b}", f"{i}"]
         )
+        self._last_lightbar = (r, g, b, i)
 
     def toggle_xboxdrv(self):
         """Toggle the xboxdrv process on or off."""
@@ -163,51 +446,163 @@ class GamepadController:
             self.log("Starting xboxdrv...")
             self.xboxdrv_process = subprocess.Popen(
                 ["/opt/scripts/simulate-xbox360-controller.sh", self.device_path],
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
+                stdout=self._devnull,
+                stderr=self._devnull,
+                close_fds=False,
                 start_new_session=True,
             )
             self.log(f"xboxdrv started with PID {self.xboxdrv_process.pid}.")
         self.update_lightbar()
 
-    def handle_event(self, event):
+    def handle_event(
+        self,
+        event_type,
+        code,
+        value,
+        _ev_syn=EV_SYN,
+        _ev_abs=EV_ABS,
+        _ev_key=EV_KEY,
+        _now=time.monotonic,
+    ):
         """Handle input events from the gamepad."""
 
+        # Ignore the EV_SYN that terminates every report
+        if event_type == _ev_syn:
+            return
+
         # Track thumbstick activity
-        if event.type == evdev.ecodes.EV_ABS:
-            if event.value < 120 or event.value > 140:
-                self.last_timestamp = time.time()
+        if event_type == _ev_abs:
+            if value < 120 or value > 140:
+                self.last_timestamp = _now()
 
         # Track normal button activity
-        if event.type == evdev.ecodes.EV_KEY:
-            key_event = evdev.categorize(event)
-            self.last_timestamp = time.time()
-            if key_event.keystate == key_event.key_down:
-                self.log(f"button {event.code} pressed")
-                self.pressed_buttons.add(event.code)
-                if self.pressed_buttons.issuperset(self.reset_combo):
-                    self.log("reset combo pressed")
-                    self.pressed_buttons = set()
-                    self.restart_tty()
-                    return
-                if self.pressed_buttons.issuperset(self.tty11_combo):
-                    self.log("tty11 combo pressed")
-                    self.pressed_buttons = set()
-                    self.enable_tty(11)
-                    return
-                if self.pressed_buttons.issuperset(self.mangohud_combo):
-                    self.log("mangohud combo pressed")
-                    self.pressed_buttons = set()
-                    self.toggle_mangohud()
+        if event_type == _ev_key:
+            self.last_timestamp = _now()
+            # Buttons that are not part of any combo need no tracking
+            if code not in self._combo_buttons:
+                return
+            if value == 1:  # key down
+                self.log(f"button {code} pressed")
+                bits = self._pressed_bits | self._button_bits[code]
+                self._pressed_bits = bits
+                if bits & self._combo_gate != self._combo_gate:
                     return
-                if self.pressed_buttons.issuperset(self.xboxdrv_combo):
-                    self.log("xboxdrv combo pressed")
-                    self.pressed_buttons = set()
-                    self.toggle_xboxdrv()
-                    return
-            elif key_event.keystate == key_event.key_up:
-                self.log(f"button {event.code} released")
-                self.pressed_buttons.discard(event.code)
+                for mask, name, handler in self._combo_table:
+                    if bits & mask == mask:
+                        self.log(f"{name} combo pressed")
+                        self._pressed_bits = 0
+                        handler()
+                        return
+            elif value == 0:  # key up
+                self.log(f"button {code} released")
+                self._pressed_bits &= ~self._button_bits[code]
+
+    def _specialized_handle_event(self):
+        """Generate a handle_event with the combo masks and event types inlined.
+
+        Behaves exactly like handle_event, minus the table and attribute lookups.
+        """
+
+        gate = self._combo_gate
+        lines = [
+            "def handle_event(self, event_type, code, value, _now=_now):",
+            f"    if event_type == {EV_ABS}:",
+            "        if value < 120 or value > 140:",
+            "            self.last_timestamp = _now()",
+            "        return",
+            f"    if event_type != {EV_KEY}:",
+            "        return",
+            "    self.last_timestamp = _now()",
+            "    bit = _button_bits.get(code)",
+            "    if bit is None:",
+            "        return",
+            "    if value == 1:",
+            "        self.log(f'button {code} pressed')",
+            "        bits = self._pressed_bits | bit",
+            "        self._pressed_bits = bits",
+            f"        if bits & {gate} != {gate}:",
+            "            return",
+        ]
+        for index, (mask, name, _) in enumerate(self._combo_table):
+            lines += [
+                f"        if bits & {mask} == {mask}:",
+                f"            self.log({name + ' combo pressed'!r})",
+                "            self._pressed_bits = 0",
+                f"            _handlers[{index}]()",
+                "            return",
+            ]
+        lines += [
+            "    elif value == 0:",
+            "        self.log(f'button {code} released')",
+            "        self._pressed_bits &= ~bit",
+        ]
+
+        namespace = {
+            "_now": time.monotonic,
+            "_button_bits": self._button_bits,
+            "_handlers": tuple(handler for _, _, handler in self._combo_table),
+        }
+        exec("\n".join(lines), namespace)
+        return types.MethodType(namespace["handle_event"], self)
+
+    def filter_stick_jitter(self, fd):
+        """Raise the kernel fuzz of the stick axes so idle jitter is dropped."""
+
+        for axis in STICK_AXES:
+            try:
+                absinfo = bytearray(INPUT_ABSINFO.size)
+                fcntl.ioctl(fd, EVIOCGABS(axis), absinfo)
+                value, minimum, maximum, fuzz, flat, resolution = (
+                    INPUT_ABSINFO.unpack(absinfo)
+                )
+                if fuzz >= self.stick_fuzz:
+                    continue
+                fcntl.ioctl(
+                    fd,
+                    EVIOCSABS(axis),
+                    INPUT_ABSINFO.pack(
+                        value, minimum, maximum, self.stick_fuzz, flat, resolution
+                    ),
+                )
+                self._saved_absinfo[axis] = bytes(absinfo)
+            except OSError as e:
+                self.log(f"Cannot set fuzz on axis {axis}: {e}")
+
+    def restore_stick_fuzz(self, fd):
+        """Put back the stick fuzz that filter_stick_jitter replaced."""
+
+        for axis, absinfo in self._saved_absinfo.items():
+            try:
+                current = bytearray(INPUT_ABSINFO.size)
+                fcntl.ioctl(fd, EVIOCGABS(axis), current)
+                # Keep the live value; only the fuzz is ours to restore.
+                value = INPUT_ABSINFO.unpack(current)[0]
+                fcntl.ioctl(
+                    fd,
+                    EVIOCSABS(axis),
+                    INPUT_ABSINFO.pack(value, *INPUT_ABSINFO.unpack(absinfo)[1:]),
+                )
+            except OSError:
+                # The device is gone; there is nothing left to restore.
+                return
+        self._saved_absinfo.clear()
+
+    def read_events(self, fd):
+        """Read and handle every event queued on the device."""
+
+        buffer = self._event_buffer
+        view = memoryview(buffer)
+        iter_unpack = self._event_struct.iter_unpack
+        handle_event = self.handle_event
+        while True:
+            try:
+                n = os.readv(fd, [buffer])
+            except BlockingIOError:
+                return
+            for _, _, event_type, code, value in iter_unpack(view[:n]):
+                handle_event(event_type, code, value)
+            if n < len(buffer):
+                return
 
     def main_loop(self):
         """Main loop to read events from the gamepad and handle them."""
@@ -217,27 +612,60 @@ class GamepadController:
         self.log(f"Bluetooth : {self.is_bluetooth}")
 
         if self.is_bluetooth:
-            time.sleep(0.5)
+            self.wait_bt_ready()
             self.set_lightbar_state("off")
-            time.sleep(0.5)
-            self.set_lightbar(0, 0, 255)
-        else:
-            self.set_lightbar(0, 0, 255)
+        self.set_lightbar(0, 0, 255)
 
         try:
-            device = evdev.InputDevice(self.device_path)
+            device_fd = os.open(self.device_path, os.O_RDONLY | os.O_NONBLOCK)
         except FileNotFoundError:
             self.log(f"Error: Device {self.device_path} not found!")
             sys.exit(1)
 
+        # systemd stops the service with SIGTERM; exit through SystemExit so
+        # the finally below still restores the stick fuzz.
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        self.filter_stick_jitter(device_fd)
+
+        selector = selectors.DefaultSelector()
+        selector.register(device_fd, selectors.EVENT_READ)
+
+        # Let the kernel wake us when the idle period may have expired.
+        idle_timer = None
+        if self.is_bluetooth and hasattr(os, "timerfd_create"):
+            idle_timer = os.timerfd_create(
+                time.CLOCK_MONOTONIC, flags=os.TFD_NONBLOCK | os.TFD_CLOEXEC
+            )
+            os.timerfd_settime(idle_timer, initial=self.idle_timeout)
+            selector.register(idle_timer, selectors.EVENT_READ)
+
         try:
-            for event in device.read_loop():
+            while True:
+                timeout = None
+                if self.is_bluetooth and idle_timer is None:
+                    timeout = max(
+                        self.last_timestamp + self.idle_timeout - time.monotonic(), 0
+                    )
+                self.flush_log()
+                ready = {key.fd for key, _ in selector.select(timeout)}
+
+                if device_fd in ready:
+                    self.read_events(device_fd)
+
+                if idle_timer in ready:
+                    os.read(idle_timer, 8)
+                elif idle_timer is not None or not self.is_bluetooth:
+                    continue
+
                 # If no activity in the last 5 minutes, disconnect.
-                if self.is_bluetooth and time.time() - self.last_timestamp > 300:
+                remaining = self.last_timestamp + self.idle_timeout - time.monotonic()
+                if remaining <= 0:
                     self.log("Bluetooth controller is idle. Disconnecting.")
                     self.disconnect_bluetooth()
-                    self.last_timestamp = time.time()
-                self.handle_event(event)
+                    self.last_timestamp = time.monotonic()
+                    remaining = self.idle_timeout
+                if idle_timer is not None:
+                    os.timerfd_settime(idle_timer, initial=remaining)
         except KeyboardInterrupt:
             self.log("Terminated by user (KeyboardInterrupt).")
         except OSError:
@@ -247,6 +675,8 @@ class GamepadController:
                 os.killpg(os.getpgid(self.xboxdrv_process.pid), signal.SIGKILL)
                 self.xboxdrv_process = None
             sys.exit(0)
+        finally:
+            self.restore_stick_fuzz(device_fd)
 
 
 def main():